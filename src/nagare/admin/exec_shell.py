@@ -22,15 +22,16 @@ In both cases:
 import os
 import sys
 import code
+import atexit
+import pathlib
 import argparse
+import functools
+import threading
+import contextlib
+import importlib.util
+import importlib.machinery
 
-try:
-    import __builtin__ as builtins
-except ImportError:
-    import builtins
-
-from nagare.admin import admin, command
-from nagare.server import reference
+from nagare.admin import command
 
 
 class Commands(command.Commands):
@@ -40,22 +41,44 @@ class Commands(command.Commands):
 # -----------------------------------------------------------------------------
 
 
+@functools.lru_cache(maxsize=1)
+def _banner():
+    from nagare.admin import admin
+
+    return admin.NAGARE_BANNER + '\n' + 'Python {} on {}\n\n'.format(sys.version, sys.platform)
+
+
+@functools.lru_cache(maxsize=1)
+def _history_path():
+    return str(pathlib.Path.home() / '.nagarehistory')
+
+
+@functools.lru_cache(maxsize=1)
+def _ipython_prompts_class(ipython):
+    """Create, once, the IPython prompts class."""
+    token = ipython.terminal.prompts.Token
+
+    class NagarePrompts(ipython.terminal.prompts.Prompts):
+        def __init__(self, shell, prompt):
+            super(NagarePrompts, self).__init__(shell)
+
+            self.left_token = (token.Prompt, 'Nagare%s [' % prompt)
+            self.right_token = (token.Prompt, ']: ')
+
+        def in_prompt_tokens(self, cli=None):
+            return [self.left_token, (token.PromptNum, str(self.shell.execution_count)), self.right_token]
+
+    return NagarePrompts
+
+
 class IPythonShell(object):
     """A IPython >= 7.20.0 interpreter."""
 
     def __init__(self, ipython, banner, prompt, ns):
-        class NagarePrompts(ipython.terminal.prompts.Prompts):
-            def in_prompt_tokens(self, cli=None):
-                return [
-                    (ipython.terminal.prompts.Token.Prompt, 'Nagare%s [' % prompt),
-                    (ipython.terminal.prompts.Token.PromptNum, str(self.shell.execution_count)),
-                    (ipython.terminal.prompts.Token.Prompt, ']: '),
-                ]
-
         self.shell = ipython.terminal.embed.InteractiveShellEmbed.instance(
             banner1=banner, user_ns=ns, confirm_exit=False
         )
-        self.shell.prompts = NagarePrompts(self.shell)
+        self.shell.prompts = _ipython_prompts_class(ipython)(self.shell, prompt)
 
     def __call__(self):
         self.shell()
@@ -75,9 +98,10 @@ class PythonShell(code.InteractiveConsole):
         code.InteractiveConsole.__init__(self, ns)
         self.banner = banner
         self.prompt = prompt
+        self.prompt_prefix = 'Nagare' + prompt
 
     def raw_input(self, prompt):
-        return code.InteractiveConsole.raw_input(self, 'Nagare' + self.prompt + prompt)
+        return code.InteractiveConsole.raw_input(self, self.prompt_prefix + prompt)
 
     def __call__(self):
         try:
@@ -92,6 +116,22 @@ class PythonShell(code.InteractiveConsole):
 class PythonShellWithHistory(PythonShell):
     """A plain Python interpreter with a readline history."""
 
+    HISTORY_WRITE_TIMEOUT = 2  # Max seconds to wait for the history to be written, at exit
+
+    @staticmethod
+    def write_history(readline, history_path):
+        # Written aside then moved, so an interrupted write leaves the previous history intact
+        tmp_path = '{}.{}.tmp'.format(history_path, os.getpid())
+
+        try:
+            readline.write_history_file(tmp_path)
+            os.replace(tmp_path, history_path)
+        except OSError as e:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+            print("Can't write the history file '{}': {}".format(history_path, e), file=sys.stderr)
+
     def __call__(self, readline):
         """Launch the interpreter.
 
@@ -102,70 +142,156 @@ class PythonShellWithHistory(PythonShell):
         # Set completion on TAB and a dedicated commands history file
         readline.parse_and_bind('tab: complete')
 
-        history_path = os.path.expanduser('~/.nagarehistory')
+        history_path = _history_path()
 
-        if os.path.exists(history_path):
+        with contextlib.suppress(FileNotFoundError):
             readline.read_history_file(history_path)
 
         readline.set_history_length(200)
 
         PythonShell.__call__(self)
 
-        readline.write_history_file(history_path)
+        # Don't block the shell teardown on a slow (e.g. network) filesystem
+        # and wait a bounded time for the write to complete before the interpreter exits
+        writer = threading.Thread(target=self.write_history, args=(readline, history_path), daemon=True)
+        writer.start()
+        atexit.register(writer.join, self.HISTORY_WRITE_TIMEOUT)
 
 
-def create_python_shell(plain, banner, prompt, **ns):
-    """Shell factory.
+@functools.lru_cache(maxsize=1)
+def _ptpython_prompt_class(prompt_style):
+    """Create, once, the PtPython prompt style class."""
 
-    Create a shell according to the installed modules (``readline`` and ``ipython``)
+    class NagarePrompt(prompt_style.ClassicPrompt):
+        def __init__(self, prompt):
+            self.prompt = prompt
 
-    In:
-      - ``ipython`` -- does the user want a IPython shell?
-      - ``banner`` -- banner to display
-      - ``prompt`` -- name of the activated application
-      - ``ns`` -- the namespace with the ``apps`` and ``session`` variables defined
+        def in_prompt(self):
+            return [(super(NagarePrompt, self).in_prompt()[0][0], 'Nagare%s>>> ' % self.prompt)]
+
+        def in2_prompt(self, width):
+            return [(super(NagarePrompt, self).in2_prompt(width)[0][0], 'Nagare%s... ' % self.prompt)]
+
+    return NagarePrompt
+
+
+def ptpython_shell():
+    """Import PtPython and return its launcher."""
+    from ptpython import repl, prompt_style
+
+    def launch(banner, prompt, ns):
+        def configure(repl):
+            repl.all_prompt_styles['nagare'] = _ptpython_prompt_class(prompt_style)(prompt)
+            repl.prompt_style = 'nagare'
+
+        print(banner)
+
+        repl.embed(globals(), ns, history_filename=_history_path(), configure=configure)
+
+    return launch
+
+
+def bpython_shell():
+    """Import BPython and return its launcher."""
+    from bpython import embed
+
+    def launch(banner, prompt, ns):
+        sys.ps1 = 'Nagare' + prompt + '>>> '
+        sys.ps2 = 'Nagare' + prompt + '... '
+
+        embed(ns, banner=banner)
+
+    return launch
+
+
+def ipython_shell():
+    """Import IPython and return its launcher."""
+    import IPython
+
+    def launch(banner, prompt, ns):
+        IPythonShell(IPython, banner, prompt, ns)()
+
+    return launch
+
+
+# Enhanced interpreters, by order of preference: module name -> shell loader
+SHELL_BACKENDS = (('ptpython', ptpython_shell), ('bpython', bpython_shell), ('IPython', ipython_shell))
+
+
+def _registered_shell_backends():
+    """Entry-points of the enhanced interpreters registered by other packages."""
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        from importlib_metadata import entry_points
+
+    entries = entry_points()
+    if hasattr(entries, 'select'):
+        entries = entries.select(group='nagare.shell_backends')
+    else:
+        entries = entries.get('nagare.shell_backends', ())
+
+    return sorted(entries, key=lambda entry: (entry.name, entry.value))
+
+
+def find_shell_backends():
+    """Generate the loaders of the installed enhanced interpreters, by order of preference.
+
+    A loader imports its interpreter and returns its launcher.
+
+    Only the location of the built-in interpreters modules is looked up, not their code.
+    The interpreters registered under the ``nagare.shell_backends`` entry-points group
+    are only scanned when no built-in one could be loaded
     """
-    if not plain:
+    for module, loader in SHELL_BACKENDS:
+        if importlib.util.find_spec(module) is not None:
+            yield loader
+
+    for entry in _registered_shell_backends():
         try:
-            from ptpython import repl, prompt_style
+            loader = entry.load()
         except ImportError:
-            pass
-        else:
+            continue
 
-            def configure(repl):
-                class NagarePrompt(prompt_style.ClassicPrompt):
-                    def in_prompt(self):
-                        return [(super(NagarePrompt, self).in_prompt()[0][0], 'Nagare%s>>> ' % prompt)]
+        yield loader
 
-                    def in2_prompt(self, width):
-                        return [(super(NagarePrompt, self).in2_prompt(width)[0][0], 'Nagare%s... ' % prompt)]
 
-                repl.all_prompt_styles['nagare'] = NagarePrompt()
-                repl.prompt_style = 'nagare'
+# Launcher of the enhanced interpreter successfully loaded, if any
+_shell_backend = None
 
-            print(banner)
 
-            repl.embed(globals(), ns, history_filename=os.path.expanduser('~/.nagarehistory'), configure=configure)
-            return
+def load_shell_backend():
+    """Return the launcher of the first enhanced interpreter that can be imported, if any."""
+    global _shell_backend
 
-        try:
-            from bpython import embed
-        except ImportError:
-            pass
-        else:
-            sys.ps1 = 'Nagare' + prompt + '>>> '
-            sys.ps2 = 'Nagare' + prompt + '... '
+    if _shell_backend is None:
+        for loader in find_shell_backends():
+            try:
+                _shell_backend = loader()
+            except ImportError:
+                # Installed but not importable (e.g. missing dependency): try the next one
+                continue
 
-            embed(ns, banner=banner)
-            return
+            break
 
-        try:
-            import IPython
-        except ImportError:
-            pass
-        else:
-            IPythonShell(IPython, banner, prompt, ns)()
-            return
+    return _shell_backend
+
+
+def create_python_shell(plain, banner, prompt, **ns):
+    """Shell factory.
+
+    Create a shell according to the installed modules (``readline``, ``ptpython``, ``bpython`` and ``ipython``)
+
+    In:
+      - ``plain`` -- does the user want a plain Python shell?
+      - ``banner`` -- banner to display
+      - ``prompt`` -- name of the activated application
+      - ``ns`` -- the namespace with the ``apps`` and ``session`` variables defined
+    """
+    shell = None if plain else load_shell_backend()
+    if shell is not None:
+        shell(banner, prompt, ns)
+        return
 
     try:
         import readline
@@ -204,14 +330,13 @@ class Shell(command.Command):
         ns = services_service.handle_interaction()
         ns['services'] = services_service
 
-        banner = admin.NAGARE_BANNER + '\n'
-        banner += 'Python {} on {}\n\n'.format(sys.version, sys.platform)
+        banner = _banner()
 
         if len(ns) == 1:
             banner += "Variable '{}' is available".format(next(iter(ns)))
         else:
-            variables = ["'{}'".format(variable) for variable in sorted(ns)]
-            banner += 'Variables ' + ', '.join(variables[:-1]) + ' and ' + variables[-1] + ' are available'
+            variables = sorted(ns)
+            banner += "Variables '{}' and '{}' are available".format("', '".join(variables[:-1]), variables[-1])
 
         banner += '\n'
 
@@ -223,6 +348,33 @@ class Shell(command.Command):
 # -----------------------------------------------------------------------------
 
 
+@functools.lru_cache(maxsize=1)
+def _compile_batch(filename, mtime):
+    # Through the standard loader, the bytecode is cached into ``__pycache__`` too
+    return importlib.machinery.SourceFileLoader('__main__', filename).get_code('__main__')
+
+
+def _run_batch(filename, ns):
+    """Execute the compiled batch file as the ``__main__`` module, as ``runpy.run_path()`` does.
+
+    In:
+      - ``filename`` -- path to the Python batch file
+      - ``ns`` -- the initial globals of the batch file
+    """
+    spec = importlib.util.spec_from_file_location('__main__', filename)
+    main = importlib.util.module_from_spec(spec)
+    main.__dict__.update(ns)
+
+    batch = _compile_batch(filename, os.stat(filename).st_mtime_ns)
+
+    previous_main = sys.modules['__main__']
+    sys.modules['__main__'] = main
+    try:
+        exec(batch, main.__dict__)  # noqa: S102
+    finally:
+        sys.modules['__main__'] = previous_main
+
+
 class Batch(command.Command):
     DESC = 'execute Python statements from a file'
     WITH_STARTED_SERVICES = True
@@ -233,12 +385,22 @@ class Batch(command.Command):
         parser.add_argument('batch_arguments', nargs=argparse.REMAINDER, help='optional batch arguments')
 
     def run(self, python_file, batch_arguments, services_service):
-        """Execute Python statements from a file."""
+        """Execute Python statements from a file.
+
+        The file is run as the ``__main__`` module, with the variables given as its globals,
+        leaving the ``builtins`` untouched
+        """
         sys.argv = [python_file] + batch_arguments
+        sys.path.insert(0, os.path.dirname(os.path.abspath(python_file)))
 
         ns = services_service.handle_interaction()
         ns['services'] = services_service
 
-        builtins.__dict__.update(ns)
+        if not python_file.endswith('.py'):
+            # Directory or zip archive with a ``__main__.py``, compiled file ...
+            # The plain ``.py`` files are run the same way, but from their cached bytecode
+            import runpy
 
-        reference.load_file(python_file, None)
+            runpy.run_path(python_file, init_globals=ns, run_name='__main__')
+        else:
+            _run_batch(python_file, ns)
@@ -0,0 +1,297 @@
+# --
+# Copyright (c) 2008-2024 Net-ng.
+# All rights reserved.
+#
+# This software is licensed under the BSD License, as described in
+# the file LICENSE.txt, which you should have received as part of
+# this distribution.
+# --
+
+import os
+import sys
+import builtins
+import importlib.metadata
+
+import pytest
+
+from nagare.admin import exec_shell
+
+
+class Services(object):
+    def __init__(self, **ns):
+        self.ns = ns
+
+    def handle_interaction(self):
+        return dict(self.ns)
+
+
+BATCH = """import sys
+import pickle
+
+
+class K(object):
+    pass
+
+
+services.main = (__name__, sys.modules['__main__'].__dict__ is globals(), __spec__.origin, __loader__ is not None)
+services.pickled = pickle.loads(pickle.dumps(K())).__class__ is K
+services.result = (__file__, sys.argv, app)
+"""
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', sys.argv[:])
+    monkeypatch.setattr(sys, 'path', sys.path[:])
+
+    return exec_shell.Batch.__new__(exec_shell.Batch)
+
+
+# -----------------------------------------------------------------------------
+
+
+def test_batch_python_file(tmp_path, batch):
+    python_file = tmp_path / 'batch.py'
+    python_file.write_text(BATCH + 'services.path = sys.path[0]\n')
+
+    main = sys.modules['__main__']
+    services = Services(app='my_app')
+    batch.run(str(python_file), ['-v', 'arg'], services)
+
+    assert services.main == ('__main__', True, str(python_file), True)
+    assert services.pickled
+    assert services.result == (str(python_file), [str(python_file), '-v', 'arg'], 'my_app')
+    assert services.path == str(tmp_path)
+
+    assert sys.modules['__main__'] is main
+    assert not hasattr(builtins, 'app')
+    assert not hasattr(builtins, 'services')
+
+
+def test_batch_recompile(tmp_path, batch):
+    python_file = tmp_path / 'batch.py'
+    python_file.write_text('services.result = 1\n')
+
+    services = Services()
+    batch.run(str(python_file), [], services)
+    assert services.result == 1
+
+    hits = exec_shell._compile_batch.cache_info().hits
+    batch.run(str(python_file), [], services)
+    assert services.result == 1
+    assert exec_shell._compile_batch.cache_info().hits == hits + 1
+
+    python_file.write_text('services.result = 2\n')
+    stat = os.stat(python_file)
+    os.utime(python_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    batch.run(str(python_file), [], services)
+    assert services.result == 2
+
+
+def test_batch_directory(tmp_path, batch):
+    directory = tmp_path / 'batch'
+    directory.mkdir()
+    python_file = directory / '__main__.py'
+    python_file.write_text(BATCH)
+
+    main = sys.modules['__main__']
+    services = Services(app='my_app')
+    batch.run(str(directory), ['arg'], services)
+
+    assert services.main == ('__main__', True, str(python_file), True)
+    assert services.pickled
+    assert services.result == (str(python_file), [str(directory), 'arg'], 'my_app')
+
+    assert sys.modules['__main__'] is main
+    assert not hasattr(builtins, 'app')
+    assert not hasattr(builtins, 'services')
+
+
+# -----------------------------------------------------------------------------
+
+
+class Entry(object):
+    def __init__(self, name, value, loader=None):
+        self.name = name
+        self.value = value
+        self.loader = loader
+
+    def load(self):
+        if self.loader is None:
+            raise ModuleNotFoundError(self.value)
+
+        return self.loader
+
+
+@pytest.fixture
+def launched(monkeypatch):
+    monkeypatch.setattr(exec_shell, '_shell_backend', None)
+    monkeypatch.setattr(importlib.metadata, 'entry_points', dict)
+
+    return []
+
+
+def loader(launched, name, error=None):
+    def load():
+        if error is not None:
+            raise error
+
+        def launch(banner, prompt, ns):
+            launched.append(name)
+
+        return launch
+
+    return load
+
+
+def test_shell_backends_order(monkeypatch, launched):
+    loaders = [loader(launched, name) for name in ('missing', 'json', 'os')]
+    monkeypatch.setattr(
+        exec_shell, 'SHELL_BACKENDS', (('nagare_missing_module', loaders[0]), ('json', loaders[1]), ('os', loaders[2]))
+    )
+
+    assert list(exec_shell.find_shell_backends()) == loaders[1:]
+
+
+def test_shell_backends_registered(monkeypatch, launched):
+    loaders = [loader(launched, name) for name in ('a', 'b')]
+    entries = [Entry('b', 'b:shell', loaders[1]), Entry('a', 'c.shell:shell'), Entry('a', 'a:shell', loaders[0])]
+
+    monkeypatch.setattr(importlib.metadata, 'entry_points', lambda: {'nagare.shell_backends': entries})
+    monkeypatch.setattr(exec_shell, 'SHELL_BACKENDS', (('nagare_missing_module', loader(launched, 'missing')),))
+
+    assert list(exec_shell.find_shell_backends()) == loaders
+
+
+def test_shell_backends_import_error(monkeypatch, launched):
+    broken = loader(launched, 'json', ImportError('json'))
+    monkeypatch.setattr(exec_shell, 'SHELL_BACKENDS', (('json', broken), ('os', loader(launched, 'os'))))
+
+    exec_shell.create_python_shell(False, '', '')
+    assert launched == ['os']
+
+    shell = exec_shell._shell_backend
+    assert exec_shell.load_shell_backend() is shell
+
+
+def test_shell_backends_import_error_in_session(monkeypatch, launched):
+    def launch(banner, prompt, ns):
+        raise ImportError('jedi')
+
+    monkeypatch.setattr(exec_shell, 'SHELL_BACKENDS', (('json', lambda: launch), ('os', loader(launched, 'os'))))
+
+    with pytest.raises(ImportError):
+        exec_shell.create_python_shell(False, '', '')
+
+    assert launched == []
+
+
+def test_shell_backends_none(monkeypatch, launched):
+    broken = loader(launched, 'json', ImportError('json'))
+    monkeypatch.setattr(exec_shell, 'SHELL_BACKENDS', (('json', broken), ('nagare_missing_module', broken)))
+
+    assert exec_shell.load_shell_backend() is None
+    assert exec_shell._shell_backend is None
+
+
+def test_shell_backends_registered_not_scanned(monkeypatch, launched):
+    def entry_points():
+        raise AssertionError('entry-points scanned')
+
+    monkeypatch.setattr(importlib.metadata, 'entry_points', entry_points)
+    monkeypatch.setattr(exec_shell, 'SHELL_BACKENDS', (('os', loader(launched, 'os')),))
+
+    exec_shell.create_python_shell(False, '', '')
+    assert launched == ['os']
+
+
+# -----------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    'ns, variables',
+    [
+        ({}, "Variable 'services' is available"),
+        ({'app': None}, "Variables 'app' and 'services' are available"),
+        ({'session': None, 'app': None}, "Variables 'app', 'services' and 'session' are available"),
+    ],
+)
+def test_shell_banner(monkeypatch, ns, variables):
+    shells = []
+    monkeypatch.setattr(exec_shell, '_banner', lambda: 'BANNER\n')
+    monkeypatch.setattr(exec_shell, 'create_python_shell', lambda *args, **ns: shells.append((args, ns)))
+
+    services = Services(**ns)
+    exec_shell.Shell.__new__(exec_shell.Shell).run(services, plain=True)
+
+    ((args, shell_ns),) = shells
+    assert args == (True, 'BANNER\n' + variables + '\n', '')
+    assert shell_ns == dict(ns, services=services, __name__='__console__')
+
+
+# -----------------------------------------------------------------------------
+
+
+class Readline(object):
+    def __init__(self, error=None):
+        self.error = error
+        self.history = []
+
+    def parse_and_bind(self, binding):
+        pass
+
+    def set_history_length(self, length):
+        pass
+
+    def read_history_file(self, filename):
+        with open(filename) as f:
+            self.history = f.read().splitlines()
+
+    def write_history_file(self, filename):
+        if self.error is not None:
+            raise self.error
+
+        with open(filename, 'w') as f:
+            f.write('\n'.join(self.history + ['new']))
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    history_path = tmp_path / '.nagarehistory'
+    joins = []
+
+    monkeypatch.setattr(exec_shell, '_history_path', lambda: str(history_path))
+    monkeypatch.setattr(exec_shell.PythonShell, '__call__', lambda self: None)
+    monkeypatch.setattr(exec_shell.atexit, 'register', lambda f, *args: joins.append((f, args)))
+
+    return history_path, joins
+
+
+def test_history_write(history):
+    history_path, joins = history
+    history_path.write_text('old')
+
+    exec_shell.PythonShellWithHistory('', '', {})(Readline())
+
+    ((join, args),) = joins
+    assert join.__self__.daemon
+    assert args == (exec_shell.PythonShellWithHistory.HISTORY_WRITE_TIMEOUT,)
+
+    join(*args)
+    assert history_path.read_text() == 'old\nnew'
+    assert os.listdir(history_path.parent) == [history_path.name]
+
+
+def test_history_write_error(history, capsys):
+    history_path, joins = history
+    history_path.write_text('old')
+
+    exec_shell.PythonShellWithHistory('', '', {})(Readline(PermissionError(13, 'Permission denied')))
+
+    ((join, args),) = joins
+    join(*args)
+
+    assert "Can't write the history file" in capsys.readouterr().err
+    assert history_path.read_text() == 'old'
+    assert os.listdir(history_path.parent) == [history_path.name]